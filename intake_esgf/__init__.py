@@ -31,7 +31,17 @@ def supported_projects() -> list[str]:
 IN_NOTEBOOK = in_notebook()
 
 from intake_esgf.catalog import ESGFCatalog  # noqa
-from intake_esgf.config import conf  # noqa
 from intake_esgf._version import __version__  # noqa
 
+
+def __getattr__(name: str):
+    # defer reading the configuration until it is first used
+    if name == "conf":
+        from intake_esgf import config
+
+        globals()["conf"] = config.conf
+        return config.conf
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 __all__ = ["ESGFCatalog", "conf", "IN_NOTEBOOK", "supported_projects"]
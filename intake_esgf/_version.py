@@ -0,0 +1 @@
+__version__ = "0.0.0.post1.dev1+g16bc83dd2"
@@ -1,26 +1,32 @@
 """General functions used in various parts of intake-esgf."""
 
 import hashlib
+import json
+import os
 import re
+import threading
 import time
-from functools import partial
+from collections.abc import Callable, Iterable
+from functools import lru_cache, partial
+from multiprocessing.pool import ThreadPool
 from pathlib import Path
 from typing import Any
+from urllib.parse import urlsplit
 
 import pandas as pd
 import requests
 import xarray as xr
-from globus_sdk import TransferAPIError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import intake_esgf
-from intake_esgf.core.globus import get_authorized_transfer_client
 from intake_esgf.database import (
-    get_download_rate_dataframe,
+    get_download_rates,
     log_download_information,
     sort_download_links,
 )
 from intake_esgf.exceptions import NoSearchResults, ProjectNotSupported
-from intake_esgf.projects import projects
+from intake_esgf.projects import get_project_facets, projects
 
 if intake_esgf.IN_NOTEBOOK:
     from tqdm import tqdm_notebook as tqdm
@@ -29,8 +35,68 @@ else:
 
 bar_format = "{desc:>20}: {percentage:3.0f}%|{bar}|{n_fmt}/{total_fmt} [{rate_fmt:>15s}{postfix}]"
 
+# patterns applied in loops over records and variables, compiled once at import
+DIRECTORY_TEMPLATE_RE = re.compile(r"%\((\w+)\)s")
+GLOBUS_LINK_RE = re.compile(r"globus:/*([a-z0-9\-]+)/(.*)")
+CELL_MEASURES_AREA_RE = re.compile(r"area:\s(.*)")
 
-def get_local_file(path: Path, dataroots: list[Path]) -> Path:
+# large files are fetched over several connections if the server allows it
+DOWNLOAD_RANGE_PARTS = 4
+DOWNLOAD_RANGE_MIN_SIZE = 256 * 1024 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Return the HTTP session shared by the download threads and Solr index searches.
+
+    Reusing a single session keeps connections to the data and index nodes alive
+    between requests, so each does not pay for a new TCP/TLS handshake. The connection
+    pool is sized so that every download thread, each possibly fetching byte ranges
+    over several connections, can keep its connections, and transient server errors
+    are retried.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = max(32, 4 * intake_esgf.conf["num_threads"])
+            adapter = HTTPAdapter(
+                pool_connections=pool_size,
+                pool_maxsize=pool_size,
+                max_retries=Retry(
+                    total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]
+                ),
+            )
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+    return _session
+
+
+def list_directory_files(directory: Path) -> dict[str, int]:
+    """
+    Return the sizes of the files in a directory, empty if it cannot be read.
+
+    A single `os.scandir` reports on all the entries of a directory, which is much
+    cheaper than checking each file separately on networked filesystems.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            return {
+                entry.name: entry.stat().st_size for entry in entries if entry.is_file()
+            }
+    except OSError:
+        return {}
+
+
+def get_local_file(
+    path: Path,
+    dataroots: list[Path],
+    listings: dict[Path, dict[str, int]] | None = None,
+    size: int | None = None,
+) -> Path:
     """
     Return the local path to a file if it exists.
 
@@ -40,6 +106,13 @@ def get_local_file(path: Path, dataroots: list[Path]) -> Path:
         The path of the file relative to a `esgroot`.
     dataroots : list[Path]
         A list of roots to prepend to `path` to check for existence.
+    listings : dict[Path, dict[str, int]], optional
+        A cache of directory contents, see `list_directory_files`. If given, it is
+        used and filled instead of checking each file, so that files which share a
+        directory only read it once.
+    size : int, optional
+        The size of the file in bytes. If given, a file of another size, such as one
+        which is truncated, is not considered to exist.
 
     Returns
     -------
@@ -53,7 +126,16 @@ def get_local_file(path: Path, dataroots: list[Path]) -> Path:
     """
     for root in dataroots:
         local_file = (root / path).expanduser()
-        if local_file.is_file():
+        if listings is None:
+            if local_file.is_file() and (
+                size is None or local_file.stat().st_size == size
+            ):
+                return local_file
+            continue
+        if local_file.parent not in listings:
+            listings[local_file.parent] = list_directory_files(local_file.parent)
+        local_size = listings[local_file.parent].get(local_file.name)
+        if local_size is not None and (size is None or local_size == size):
             return local_file
     raise FileNotFoundError
 
@@ -81,7 +163,7 @@ def get_globus_endpoints(info: dict) -> list[str]:
         return []
     globus_endpoints = []
     for entry in info["Globus"]:
-        m = re.search(r"globus:/*([a-z0-9\-]+)/(.*)", entry)
+        m = GLOBUS_LINK_RE.search(entry)
         if not m:
             raise ValueError(f"Globus 'link' count not be parsed: {entry}")
         uuid = m.group(1)
@@ -130,16 +212,22 @@ def partition_infos(
     # to keep from checking globus endpoints active status too much, we will store them
     client = None
     active_endpoints = set()
+    if prefer_globus:
+        # only users who ask for globus transfers need the transfer client
+        from globus_sdk import TransferAPIError
+
+        from intake_esgf.core.globus import get_authorized_transfer_client
 
     # Partition and setup all the file infos based on a priority
+    dataroots = intake_esgf.conf["esg_dataroot"] + intake_esgf.conf["local_cache"]
+    listings = {}
     for i, info in enumerate(infos):
         key = info["key"]
 
         # 1) does the file already exist locally?
         try:
             local_path = get_local_file(
-                info["path"],
-                intake_esgf.conf["esg_dataroot"] + intake_esgf.conf["local_cache"],
+                info["path"], dataroots, listings, info.get("size")
             )
             if key not in ds:
                 ds[key] = []
@@ -224,11 +312,12 @@ def combine_results(dfs: list[pd.DataFrame]) -> pd.DataFrame:
     variable_facet = project.variable_facet()
     combine_time = time.time()
     df = df.drop_duplicates(subset=[variable_facet, "id"]).reset_index(drop=True)
-    # now convert groups to list
-    for _, grp in df.groupby(project.master_id_facets(), dropna=False):
-        df = df.drop(grp.iloc[1:].index)
-        df.loc[grp.index[0], "id"] = grp.id.to_list()
-    df = df.drop(columns="data_node")
+    # now convert groups to list, keeping the first row of each group
+    group = df.groupby(project.master_id_facets(), dropna=False, sort=False).ngroup()
+    ids = df["id"].groupby(group, sort=True).agg(list)
+    first = ~group.duplicated()
+    df = df[first].drop(columns="data_node")
+    df["id"] = pd.Series(ids.to_list(), index=df.index)
     combine_time = time.time() - combine_time
     logger.info(f"{combine_time=:.2f}")
     return df
@@ -236,18 +325,50 @@ def combine_results(dfs: list[pd.DataFrame]) -> pd.DataFrame:
 
 def get_file_hash(filepath: str | Path, algorithm: str) -> str:
     """Get the file has using the given algorithm."""
-    algorithm = algorithm.lower()
-    assert algorithm in hashlib.algorithms_available
-    sha = hashlib.__dict__[algorithm]()
+    # checksums are for integrity, so allow the OpenSSL implementation on any build
+    sha = hashlib.new(algorithm.lower(), usedforsecurity=False)
     with open(filepath, "rb") as fp:
+        # python>=3.11 reads and hashes the file without returning to the interpreter
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(fp, lambda: sha).hexdigest()
         while True:
-            data = fp.read(64 * 1024)
+            data = fp.read(1024 * 1024)
             if not data:
                 break
             sha.update(data)
     return sha.hexdigest()
 
 
+def download_range(url: str, fd: int, start: int, end: int, pbar: tqdm) -> None:
+    """Download the inclusive byte range of the url into the file descriptor."""
+    with get_session().get(
+        url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=10
+    ) as resp:
+        resp.raise_for_status()
+        if resp.status_code != 206:
+            raise ValueError(f"Byte range not honored by {url}")
+        # progress is reported in larger steps as the bar is shared by the ranges
+        pending = 0
+        for chunk in resp.iter_content(chunk_size=1024 * 1024):
+            os.pwrite(fd, chunk, start)
+            start += len(chunk)
+            pending += len(chunk)
+            if pending >= 4 * 1024 * 1024:
+                pbar.update(pending)
+                pending = 0
+        pbar.update(pending)
+
+
+def accepts_ranges(url: str) -> bool:
+    """Return whether the server of the url honors byte range requests."""
+    # ask for a single byte, so that no more of the file is streamed than that
+    with get_session().get(
+        url, headers={"Range": "bytes=0-0"}, stream=True, timeout=10
+    ) as resp:
+        resp.raise_for_status()
+        return resp.status_code == 206
+
+
 def download_and_verify(
     url: str,
     local_file: str | Path,
@@ -267,33 +388,77 @@ def download_and_verify(
         if len(local_file.name) < max_file_length
         else f"{local_file.name[:(max_file_length-3)]}..."
     )
+    ranged = (
+        content_length >= DOWNLOAD_RANGE_MIN_SIZE
+        and hasattr(os, "pwrite")
+        and accepts_ranges(url)
+    )
     local_file.parent.mkdir(parents=True, exist_ok=True)
-    resp = requests.get(url, stream=True, timeout=10)
-    resp.raise_for_status()
-    transfer_time = time.time()
-    with open(local_file, "wb") as fdl:
-        with tqdm(
-            disable=quiet,
-            bar_format="{desc}: {percentage:3.0f}%|{bar}|{n_fmt}/{total_fmt} [{rate_fmt}{postfix}]",
-            total=content_length,
-            unit="B",
-            unit_scale=True,
-            desc=desc,
-            ascii=False,
-            leave=False,
-        ) as pbar:
-            for chunk in resp.iter_content(chunk_size=1024):
-                if chunk:
-                    fdl.write(chunk)
-                    pbar.update(len(chunk))
-    transfer_time = time.time() - transfer_time
+    # stream into a sibling which only takes the final name once verified, so an
+    # interrupted transfer is never mistaken for a finished file
+    part_file = local_file.with_name(local_file.name + ".part")
+    # the hash is computed as the file streams in so we do not re-read it from disk
+    sha = hashlib.new(hash_algorithm.lower(), usedforsecurity=False)
+    transfer_time = time.monotonic()
+    try:
+        with open(part_file, "wb") as fdl:
+            # reserve the space up front so it can be allocated contiguously
+            if content_length and hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(fdl.fileno(), 0, content_length)
+                except OSError:
+                    pass
+            with tqdm(
+                disable=quiet,
+                bar_format="{desc}: {percentage:3.0f}%|{bar}|{n_fmt}/{total_fmt} [{rate_fmt}{postfix}]",
+                total=content_length,
+                unit="B",
+                unit_scale=True,
+                desc=desc,
+                ascii=False,
+                leave=False,
+            ) as pbar:
+                if ranged:
+                    bounds = [
+                        content_length * i // DOWNLOAD_RANGE_PARTS
+                        for i in range(DOWNLOAD_RANGE_PARTS + 1)
+                    ]
+                    with ThreadPool(DOWNLOAD_RANGE_PARTS) as pool:
+                        pool.starmap(
+                            download_range,
+                            [
+                                (url, fdl.fileno(), lo, hi - 1, pbar)
+                                for lo, hi in zip(bounds[:-1], bounds[1:])
+                            ],
+                        )
+                else:
+                    with get_session().get(url, stream=True, timeout=10) as resp:
+                        resp.raise_for_status()
+                        # the bytes must pass through python to be hashed (and
+                        # decrypted for https), so there is no zero-copy path here
+                        pending = 0
+                        for chunk in resp.iter_content(chunk_size=1024 * 1024):
+                            fdl.write(chunk)
+                            sha.update(chunk)
+                            pending += len(chunk)
+                            if pending >= 4 * 1024 * 1024:
+                                pbar.update(pending)
+                                pending = 0
+                        pbar.update(pending)
+        transfer_time = time.monotonic() - transfer_time
+        # the parts arrive out of order, so only then is the file read back
+        digest = get_file_hash(part_file, hash_algorithm) if ranged else sha.hexdigest()
+        if digest != hash:
+            logger.info(f"\x1b[91;20mHash error\033[0m {url}")
+            raise ValueError("Hash does not match")
+        os.replace(part_file, local_file)
+    except BaseException:
+        # also on interrupts, so that no partial file is left behind
+        part_file.unlink(missing_ok=True)
+        raise
     rate = content_length * 1e-6 / transfer_time
-    if get_file_hash(local_file, hash_algorithm) != hash:
-        logger.info(f"\x1b[91;20mHash error\033[0m {url}")
-        local_file.unlink()
-        raise ValueError("Hash does not match")
     logger.info(f"{transfer_time=:.2f} [s] at {rate:.2f} [Mb s-1] {url}")
-    host = url[: url.index("/", 10)].replace("http://", "").replace("https://", "")
+    host = urlsplit(url).netloc
     log_download_information(download_db, host, transfer_time, content_length * 1e-6)
 
 
@@ -302,26 +467,29 @@ def parallel_download(
     local_cache: list[Path],
     download_db: Path,
     esg_dataroot: None | list[Path] = None,
+    download_rates: dict[str, float] | None = None,
 ):
     """."""
     logger = intake_esgf.conf.get_logger()
-    # does this exist on a copy we have access to?
+    # does this exist on a copy we have access to? A file of the wrong size is a
+    # corrupt or different copy, which we download again
     for path in esg_dataroot:
         if esg_dataroot is not None:
             local_file = path / info["path"]
-            if local_file.exists():
+            if local_file.is_file() and local_file.stat().st_size == info["size"]:
                 logger.info(f"accessed {local_file}")
                 return info["key"], local_file
     # have we already downloaded this?
     for path in local_cache:
         local_file = path / info["path"]
-        if local_file.exists():
+        if local_file.is_file() and local_file.stat().st_size == info["size"]:
             logger.info(f"accessed {local_file}")
             return info["key"], local_file
     # else we try to download it, first we sort links by the fastest host to you
-    df_rate = get_download_rate_dataframe(download_db)
+    if download_rates is None:
+        download_rates = get_download_rates(download_db)
     info["HTTPServer"] = sorted(
-        info["HTTPServer"], key=partial(sort_download_links, df_rate=df_rate)
+        info["HTTPServer"], key=partial(sort_download_links, rates=download_rates)
     )
     # keep trying to download until one works out
     for url in info["HTTPServer"]:
@@ -439,7 +607,7 @@ def add_cell_measures(ds: xr.Dataset, catalog) -> xr.Dataset:
     for var, da in ds.items():
         if "cell_measures" not in da.attrs:
             continue
-        m = re.search(r"area:\s(.*)", da.attrs["cell_measures"])
+        m = CELL_MEASURES_AREA_RE.search(da.attrs["cell_measures"])
         if m:
             to_add.append(m.group(1))
         if "cell_methods" not in da.attrs:
@@ -457,45 +625,262 @@ def add_cell_measures(ds: xr.Dataset, catalog) -> xr.Dataset:
     return ds
 
 
-def expand_cmip5_record(
-    search_vars: list[str], content_vars: list[str], record: dict[str, Any]
+def get_cached_dataframe(
+    name: str,
+    key: dict[str, Any],
+    max_age: float,
+    query: Callable[[], pd.DataFrame],
+    refresh: bool = False,
+) -> pd.DataFrame:
+    """
+    Return the dataframe from the query, cached on disk.
+
+    Results are stored in `~/.cache/intake-esgf/<name>`. Empty results are not cached,
+    so that data which is published in the meantime is found by the next query.
+    Cached results older than `max_age` are removed whenever a new result is stored,
+    so that the cache does not grow with every distinct query.
+
+    Parameters
+    ----------
+    name : str
+        The name of the cache, the directory in which results are stored.
+    key : dict[str, Any]
+        The arguments which uniquely identify the query.
+    max_age : float
+        The number of hours for which a cached result is used, 0 disables the cache.
+    query : Callable[[], pd.DataFrame]
+        The function which returns the dataframe if not cached.
+    refresh : bool
+        Enable to run the query even if a result is cached, storing the new result.
+
+    Returns
+    -------
+    pd.DataFrame
+        The cached or queried dataframe.
+    """
+    if max_age <= 0:
+        return query()
+    key = hashlib.md5(
+        json.dumps(key, sort_keys=True, default=str).encode(), usedforsecurity=False
+    ).hexdigest()
+    cache_file = Path.home() / ".cache" / "intake-esgf" / name / f"{key}.json"
+    max_age = max_age * 60 * 60
+    try:
+        if not refresh and time.time() - cache_file.stat().st_mtime < max_age:
+            return pd.read_json(cache_file, orient="table")
+    except (OSError, ValueError):
+        pass
+    df = query()
+    try:
+        if df.empty:
+            # also drop any result being refreshed, so it is not used again
+            cache_file.unlink(missing_ok=True)
+            return df
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        df.to_json(cache_file, orient="table")
+        now = time.time()
+        with os.scandir(cache_file.parent) as entries:
+            for entry in entries:
+                if now - entry.stat().st_mtime >= max_age:
+                    os.unlink(entry.path)
+    except OSError:
+        pass
+    return df
+
+
+def search_in_chunks(
+    search: Callable[[list[str]], Iterable[dict[str, Any]]],
+    values: list[str],
+    chunk_size: int,
 ) -> list[dict[str, Any]]:
-    """Expand the CMIP5 record to include variables."""
-    assert record["project"] == "CMIP5"
+    """
+    Return the response pages of a search over a long list of values.
+
+    Long lists of values are split into smaller searches which run concurrently, so
+    that no single request grows too large for the index to accept or to answer
+    quickly.
+
+    Parameters
+    ----------
+    search : Callable[[list[str]], Iterable[dict[str, Any]]]
+        The function which yields the response pages of a search for some values.
+    values : list[str]
+        The values to search for.
+    chunk_size : int
+        The largest number of values in a single search.
+
+    Returns
+    -------
+    list[dict[str, Any]]
+        The response pages of all the searches.
+    """
+    chunks = [values[i : i + chunk_size] for i in range(0, len(values), chunk_size)]
+    with ThreadPool(min(len(chunks), intake_esgf.conf["num_threads"]) or 1) as pool:
+        return [
+            page
+            for pages in pool.map(lambda chunk: list(search(chunk)), chunks)
+            for page in pages
+        ]
+
+
+def get_dataframe_columns(content: dict[str, Any]) -> list[str]:
+    """
+    Return the columns of the dataframe formed from index records.
+
+    These are the facets of the project defined in the content followed by any
+    `additional_df_cols` in the configuration, always with `project` first.
+
+    Parameters
+    ----------
+    content : dict[str, Any]
+        Either the search keywords or the index content.
+
+    Returns
+    -------
+    list[str]
+        The columns to extract from each record.
+    """
+    project = content.get("project", None)
+    if isinstance(project, list):
+        project = project[0]
+    additional_df_cols = tuple(intake_esgf.conf.get("additional_df_cols", []))
+    return list(_dataframe_columns(project, additional_df_cols))
+
+
+@lru_cache(maxsize=64)
+def _dataframe_columns(
+    project: str | None, additional_df_cols: tuple[str, ...]
+) -> tuple[str, ...]:
+    """Return the dataframe columns of a project, see `get_dataframe_columns`."""
+    columns = get_project_facets({"project": project}) + list(additional_df_cols)
+    if "project" not in columns:
+        columns = ["project"] + columns
+    return tuple(columns)
+
+
+def add_records_to_columns(
+    columns: dict[str, list],
+    records: Iterable[tuple[str, dict[str, Any]]],
+    variables: list[str],
+) -> None:
+    """
+    Append the facet values of index records to the dataframe columns.
+
+    List-valued facets contribute their first value. As CMIP5 records hold many
+    variables, these are kept as a list to be expanded into rows once the dataframe is
+    built, see `columns_to_dataframe`.
+
+    Parameters
+    ----------
+    columns : dict[str, list]
+        The values of each dataframe column, appended to in place.
+    records : Iterable[tuple[str, dict[str, Any]]]
+        The id and content of each index record.
+    variables : list[str]
+        The variables which were searched for.
+    """
+    has_variable = "variable" in columns
+    for record_id, content in records:
+        content["id"] = record_id
+        for column, values in columns.items():
+            value = content.get(column)
+            values.append(value[0] if type(value) is list else value)
+        if has_variable and content["project"][0] == "CMIP5":
+            columns["variable"][-1] = get_cmip5_variables(
+                variables, content["variable"]
+            )
+
+
+def columns_to_dataframe(columns: dict[str, list]) -> pd.DataFrame:
+    """
+    Return the dataframe formed from the columns of index records.
+
+    Columns which are empty for every record are dropped and CMIP5 records are expanded
+    into a row per variable.
+
+    Parameters
+    ----------
+    columns : dict[str, list]
+        The values of each dataframe column, see `add_records_to_columns`.
+
+    Returns
+    -------
+    pd.DataFrame
+        The dataframe of records.
+    """
+    # drop the empty columns before building the dataframe, afterwards would copy the
+    # whole frame
+    df = pd.DataFrame(
+        {
+            column: values
+            for column, values in columns.items()
+            if any(value is not None for value in values)
+        }
+    )
+    if "variable" in df and (df["project"] == "CMIP5").any():
+        df = df.explode("variable", ignore_index=True)
+    return df
+
+
+def get_cmip5_variables(search_vars: list[str], content_vars: list[str]) -> list[str]:
+    """Return the variables into whose rows a CMIP5 record is to be expanded.
+
+    CMIP5 records hold many variables, we keep those which were searched for or else
+    all of them.
+
+    """
     variables = list(set(search_vars).intersection(content_vars))
     if not variables:
         variables = content_vars.copy()
-    records = []
-    for var in variables:
-        r = record.copy()
-        r["variable"] = var
-        records.append(r)
-    return records
+    return variables
+
+
+def get_dataset_version(dataset_id: str) -> str:
+    """Return the version of a dataset id of the form `master_id.version|data_node`."""
+    return dataset_id.partition("|")[0].rpartition(".")[2]
+
+
+@lru_cache(maxsize=64)
+def _template_facets(template: str) -> tuple[str, ...]:
+    """Return the facets, in order, used to fill in a directory format template."""
+    return tuple(DIRECTORY_TEMPLATE_RE.findall(template))
 
 
-def get_content_path(content: dict[str, Any]) -> Path:
+def _template_values(content: dict[str, Any]) -> tuple[str, ...]:
+    """Return the values, in order, which fill in the directory format template."""
+    # the file `_version_` is not the same as the dataset `version` so we parse it out
+    # of the `dataset_id`
+    content["version"] = [get_dataset_version(content["dataset_id"])]
+    return tuple(
+        value[0] if type(value) is list else value
+        for t in _template_facets(content["directory_format_template_"][0])
+        if (value := content.get(t)) is not None
+    )
+
+
+def get_content_path(
+    content: dict[str, Any], directories: dict[tuple[str, ...], Path] | None = None
+) -> Path:
     """Get the local path where the data is to be stored.
 
     In CMIP6 we get a directory template, we just fill in values from the content. In
     older projects we do not, but can search for the project name and grab all the text
     following it. In the end, as long as we are consistent it does not matter.
 
-    """
+    Files which fill in the template with the same values share a directory. If a
+    `directories` dictionary is given, it is used to store and reuse the directory of
+    these values across calls. The values, rather than the dataset, are the key as a
+    template may use facets which vary by file, such as the variable of a
+    multi-variable dataset.
 
-    def _form_from_template(content) -> Path:
-        template = re.findall(r"%\((\w+)\)s", content["directory_format_template_"][0])
-        template = [
-            content[t][0] if isinstance(content[t], list) else content[t]
-            for t in template
-            if t in content
-        ]
-        return Path("/".join(template)) / content["title"]
-
-    # the file `_version_` is not the same as the dataset `version` so we parse it out
-    # of the `dataset_id`
-    content["version"] = [content["dataset_id"].split("|")[0].split(".")[-1]]
+    """
     if "directory_format_template_" in content:
-        return _form_from_template(content)
+        values = _template_values(content)
+        if directories is None:
+            return Path("/".join(values)) / content["title"]
+        if values not in directories:
+            directories[values] = Path("/".join(values))
+        return directories[values] / content["title"]
 
     # otherwise we look for the project text in the url and return everything following
     # it
@@ -507,9 +892,11 @@ def get_content_path(content: dict[str, Any]) -> Path:
     )
     if not urls:
         raise ValueError(f"Could not find a http link in {content['url']}")
-    match = re.search(rf".*({project.lower()}.*.nc)|.*", urls[0])
-    if not match:
+    # the path runs from the last mention of the project before the final 'nc'
+    end = urls[0].rfind("nc")
+    start = urls[0].rfind(project.lower(), 0, end - 1) if end > 0 else -1
+    if start < 0:
         raise ValueError(f"Could not parse out the path from {urls[0]}")
     # try to fix records with case-insensitive paths
-    path = match.group(1).replace(project.lower(), project)
+    path = urls[0][start : end + 2].replace(project.lower(), project)
     return Path(path)
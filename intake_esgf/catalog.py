@@ -33,6 +33,7 @@ from intake_esgf.core.globus import (
 from intake_esgf.database import (
     create_download_database,
     get_download_rate_dataframe,
+    get_download_rates,
 )
 from intake_esgf.exceptions import (
     DatasetInitError,
@@ -47,6 +48,9 @@ if IN_NOTEBOOK:
 else:
     from tqdm import tqdm
 
+# the timestamp of a log line, compiled once as the whole log may be scanned
+LOG_TIME_RE = re.compile(r"\x1b\[36;20m(.*)\s\033\[0m")
+
 
 class ESGFCatalog:
     """
@@ -212,17 +216,12 @@ class ESGFCatalog:
         if self.df is None:
             raise ValueError("Perform a search() to populate the catalog.")
         out = {}
-        drops = [
-            col
-            for col in self.df.columns
-            if col
-            not in (
-                self.project.master_id_facets()
-                + intake_esgf.conf.get("additional_df_cols")
-            )
-        ]
-        for col in self.df.drop(columns=drops).columns:
-            out[col] = self.df[col].unique()
+        keep = set(
+            self.project.master_id_facets() + intake_esgf.conf.get("additional_df_cols")
+        )
+        for col in self.df.columns:
+            if col in keep:
+                out[col] = self.df[col].unique()
         return pd.Series(out)
 
     def model_groups(self) -> pd.Series:
@@ -275,7 +274,7 @@ class ESGFCatalog:
             .iloc[:, 0]
         )
 
-    def search(self, quiet: bool = False, **search) -> Self:
+    def search(self, quiet: bool = False, no_cache: bool = False, **search) -> Self:
         """
         Populate the catalog by specifying search facets and values.
 
@@ -283,6 +282,10 @@ class ESGFCatalog:
         ----------
         quiet
             Enable to silence the progress bar.
+        no_cache
+            Enable to query the indices even if the results of this search are
+            cached, see the `search_cache_hours` option. The cache is updated with
+            the new results.
         **search
             Any number of facet keywords and values.
         """
@@ -290,7 +293,17 @@ class ESGFCatalog:
 
         def _search(index):
             try:
-                df = index.search(**search)
+                df = base.get_cached_dataframe(
+                    "search",
+                    {
+                        "index": repr(index),
+                        "search": search,
+                        "columns": intake_esgf.conf["additional_df_cols"],
+                    },
+                    intake_esgf.conf["search_cache_hours"],
+                    partial(index.search, **search),
+                    refresh=no_cache,
+                )
             except NoSearchResults:
                 return pd.DataFrame([])
             except requests.exceptions.RequestException:
@@ -332,26 +345,29 @@ class ESGFCatalog:
 
         # threaded search over indices
         search_time = time.time()
-        dfs = ThreadPool(len(self.indices)).imap_unordered(_search, self.indices)
-        self.df = base.combine_results(
-            tqdm(
-                dfs,
-                disable=quiet,
-                bar_format=base.bar_format,
-                unit="index",
-                unit_scale=False,
-                desc="Searching indices",
-                ascii=False,
-                total=len(self.indices),
+        with ThreadPool(len(self.indices)) as pool:
+            dfs = pool.imap_unordered(_search, self.indices)
+            self.df = base.combine_results(
+                tqdm(
+                    dfs,
+                    disable=quiet,
+                    bar_format=base.bar_format,
+                    unit="index",
+                    unit_scale=False,
+                    desc="Searching indices",
+                    ascii=False,
+                    total=len(self.indices),
+                )
             )
-        )
         self._set_project()
 
         # even though we are using latest=True, because the search is distributed, we
         # may have different versions from different indices.
-        for r, row in self.df.iterrows():
-            latest = max([x.split("|")[0].split(".")[-1] for x in row.id])
-            self.df.loc[r, "id"] = [x for x in row.id if latest in x]
+        ids = self.df["id"].explode()
+        versions = ids.map(base.get_dataset_version)
+        latest = versions.groupby(level=0).transform("max")
+        keep = [version in x for x, version in zip(ids, latest)]
+        self.df["id"] = ids[keep].groupby(level=0).agg(list)
 
         search_time = time.time() - search_time
         logger.info(f"\x1b[36;32msearch end\033[0m total_time={search_time:.2f}")
@@ -398,21 +414,20 @@ class ESGFCatalog:
 
         # threaded search over indices
         search_time = time.time()
-        dfs = ThreadPool(len(self.indices)).imap_unordered(
-            _from_tracking_ids, self.indices
-        )
-        self.df = base.combine_results(
-            tqdm(
-                dfs,
-                disable=quiet,
-                bar_format=base.bar_format,
-                unit="index",
-                unit_scale=False,
-                desc="Searching indices",
-                ascii=False,
-                total=len(self.indices),
+        with ThreadPool(len(self.indices)) as pool:
+            dfs = pool.imap_unordered(_from_tracking_ids, self.indices)
+            self.df = base.combine_results(
+                tqdm(
+                    dfs,
+                    disable=quiet,
+                    bar_format=base.bar_format,
+                    unit="index",
+                    unit_scale=False,
+                    desc="Searching indices",
+                    ascii=False,
+                    total=len(self.indices),
+                )
             )
-        )
         search_time = time.time() - search_time
         if len(self.df) != len(tracking_ids):
             logger.info("One or more of the tracking_ids resolve to multiple files.")
@@ -461,20 +476,14 @@ class ESGFCatalog:
         # `separator` and placed in a new column in the dataframe called `key`
         if self.project is None:
             self._set_project()
-        self.df["key"] = self.df.apply(
-            lambda row: separator.join(
-                [row[f] for f in self.project.master_id_facets()]
-            ),
-            axis=1,
-        )
+        facets = self.project.master_id_facets()
+        self.df["key"] = self.df[facets[0]].str.cat(self.df[facets[1:]], sep=separator)
 
         # From the catalog dataframe, we have the mapping `key` -> `dataset_id` but in
         # order to pass information back we need the inverse.
-        dataset_ids = {
-            dataset_id: row["key"]
-            for _, row in self.df.iterrows()
-            for dataset_id in row["id"]
-        }
+        dataset_ids = (
+            self.df[["id", "key"]].explode("id").set_index("id")["key"].to_dict()
+        )
 
         # Some projects (CMIP5 for example) use dataset_ids to refer to collections of
         # variables. This means that the user may get many more variables than they want
@@ -489,22 +498,23 @@ class ESGFCatalog:
         # The index nodes are again queried for file information. Each file points back
         # to the dataset_id to which it belongs.
         info_time = time.time()
-        get_file_info = ThreadPool(len(self.indices)).imap_unordered(
-            partial(_get_file_info, dataset_ids=dataset_ids, **search_facets),
-            self.indices,
-        )
-        index_infos = list(
-            tqdm(
-                get_file_info,
-                disable=quiet,
-                bar_format=base.bar_format,
-                unit="index",
-                unit_scale=False,
-                desc="Get file information",
-                ascii=False,
-                total=len(self.indices),
+        with ThreadPool(len(self.indices)) as pool:
+            get_file_info = pool.imap_unordered(
+                partial(_get_file_info, dataset_ids=dataset_ids, **search_facets),
+                self.indices,
+            )
+            index_infos = list(
+                tqdm(
+                    get_file_info,
+                    disable=quiet,
+                    bar_format=base.bar_format,
+                    unit="index",
+                    unit_scale=False,
+                    desc="Get file information",
+                    ascii=False,
+                    total=len(self.indices),
+                )
             )
-        )
         index_infos = [info for index_info in index_infos for info in index_info]
 
         # Now we merge the access/validation information, but where the primary key is
@@ -512,19 +522,17 @@ class ESGFCatalog:
         combine_time = time.time()
         merged_info = {}
         for info in index_infos:
-            path = info["path"]
-            if path not in merged_info:
-                merged_info[path] = {"key": dataset_ids[info["dataset_id"]]}
+            merged = merged_info.get(str(info["path"]))
+            if merged is None:
+                merged = merged_info[str(info["path"])] = {
+                    "key": dataset_ids[info["dataset_id"]]
+                }
             for key, val in info.items():
-                if isinstance(val, list):
-                    if key not in merged_info[path]:
-                        merged_info[path][key] = val
-                    else:
-                        merged_info[path][key] += val
-                else:
-                    if key not in merged_info[path]:
-                        merged_info[path][key] = val
-        infos = [info for _, info in merged_info.items()]
+                if key not in merged:
+                    merged[key] = val
+                elif isinstance(val, list):
+                    merged[key] += val
+        infos = list(merged_info.values())
         combine_time = time.time() - combine_time
         info_time = time.time() - info_time
         logger.info(f"{combine_time=:.2f}")
@@ -595,19 +603,24 @@ class ESGFCatalog:
             if not quiet:
                 print(f"Downloading {download_size:.1f} [{download_unit}]...")
 
-            list(
-                ThreadPool(
-                    min(intake_esgf.conf["num_threads"], len(infos["https"]))
-                ).imap_unordered(
-                    partial(
-                        base.parallel_download,
-                        local_cache=self.local_cache,
-                        download_db=self.download_db,
-                        esg_dataroot=self.esg_dataroot,
-                    ),
-                    infos["https"],
+            # rank the hosts once for all the files in this batch
+            download_rates = get_download_rates(self.download_db)
+            with ThreadPool(
+                min(intake_esgf.conf["num_threads"], len(infos["https"]))
+            ) as pool:
+                list(
+                    pool.imap_unordered(
+                        partial(
+                            base.parallel_download,
+                            local_cache=self.local_cache,
+                            download_db=self.download_db,
+                            esg_dataroot=self.esg_dataroot,
+                            download_rates=download_rates,
+                        ),
+                        # start the largest files first so the pool finishes together
+                        sorted(infos["https"], key=lambda i: i["size"], reverse=True),
+                    )
                 )
-            )
 
         # unpack the https files which should now exist in local cache
         dsd = _load_into_dsd(dsd, infos["https"])
@@ -715,11 +728,10 @@ class ESGFCatalog:
         # master_id facets should be in the global attributes of each file, but
         # sometimes they aren't
         master_id_facets = self.project.master_id_facets()
+        attrs = self.df.set_index("key")[master_id_facets]
+        assert attrs.index.is_unique
         for key in ds:
-            row = self.df.loc[self.df["key"] == key]
-            assert len(row) == 1
-            row = row.iloc[0]
-            ds[key].attrs.update(row[master_id_facets].to_dict())
+            ds[key].attrs.update(attrs.loc[key].to_dict())
 
         # attempt to add cell measures (serial), only work for CMIP6 for now
         if ds and add_measures and "cmip6" in str(self.project.__class__).lower():
@@ -802,7 +814,7 @@ class ESGFCatalog:
         """
         log = open(Path(intake_esgf.conf["logfile"]).expanduser()).readlines()[::-1]
         for n, line in enumerate(log):
-            m = re.search(r"\x1b\[36;20m(.*)\s\033\[0m", line)
+            m = LOG_TIME_RE.search(line)
             if not m:
                 continue
             if pd.to_datetime(m.group(1)) < (
@@ -5,8 +5,6 @@ import copy
 import logging
 from pathlib import Path
 
-import yaml
-
 defaults = {
     "globus_indices": {
         "anl-dev": True,
@@ -34,8 +32,30 @@ defaults = {
     "download_db": "~/.config/intake-esgf/download.db",
     "num_threads": 6,
     "break_on_error": True,
+    "search_cache_hours": 6,
+    "variable_info_cache_hours": 24,
 }
 
+# parsed configuration files, keyed by path and stored with their (mtime, size)
+_parsed_files: dict[Path, tuple[tuple[int, int], dict | None]] = {}
+
+# the package logger along with the logfile setting it was configured for
+_logger: tuple[str, logging.Logger] | None = None
+
+
+def _yaml_load(stream):
+    """Load YAML using libyaml if available."""
+    import yaml
+
+    return yaml.load(stream, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+
+def _yaml_dump(data, stream=None):
+    """Dump YAML using libyaml if available."""
+    import yaml
+
+    return yaml.dump(data, stream, Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper))
+
 
 class Config(dict):
     """A global configuration object used in the package."""
@@ -52,7 +72,7 @@ class Config(dict):
         super().__init__(**kwargs)
 
     def __repr__(self):
-        return yaml.dump(dict(self))
+        return _yaml_dump(dict(self))
 
     def reset(self):
         """Return to defaults."""
@@ -64,7 +84,7 @@ class Config(dict):
         filename = filename or self.filename
         filename.parent.mkdir(parents=True, exist_ok=True)
         with open(filename, "w") as f:
-            yaml.dump(dict(self), f)
+            _yaml_dump(dict(self), f)
 
     @contextlib.contextmanager
     def _unset(self, temp):
@@ -81,7 +101,9 @@ class Config(dict):
         local_cache: list[str] | None = None,
         additional_df_cols: list[str] | None = None,
         num_threads: int | None = None,
-        break_on_error: bool | None = None
+        break_on_error: bool | None = None,
+        search_cache_hours: float | None = None,
+        variable_info_cache_hours: float | None = None,
     ):
         """Change intake-esgf configuration options.
 
@@ -103,13 +125,23 @@ class Config(dict):
             The number of threads to use when downloading via https.
         break_on_error: bool
             Should a user script continue if any of the datasets fail to load?
+        search_cache_hours: float
+            The number of hours for which index search results are cached on
+            disk, 0 disables the cache.
+        variable_info_cache_hours: float
+            The number of hours for which variable information is cached on disk,
+            0 disables the cache.
 
         Examples
         --------
         >>> intake-esgf.conf.set(indices={'esgf-node.ornl.gov': True})
 
         """
-        temp = copy.deepcopy(self)
+        # options are at most one level deep, so copying each value is enough
+        temp = {
+            key: val.copy() if isinstance(val, (dict, list)) else val
+            for key, val in self.items()
+        }
         self["globus_indices"].update(
             {
                 key: value
@@ -147,6 +179,10 @@ class Config(dict):
             self["num_threads"] = int(num_threads)
         if break_on_error is not None:
             self["break_on_error"] = bool(break_on_error)
+        if search_cache_hours is not None:
+            self["search_cache_hours"] = float(search_cache_hours)
+        if variable_info_cache_hours is not None:
+            self["variable_info_cache_hours"] = float(variable_info_cache_hours)
         return self._unset(temp)
 
     def __getitem__(self, item):
@@ -169,15 +205,31 @@ class Config(dict):
     def load(self, filename: Path | None = None):
         """Update global config from YAML file or default file if None."""
         filename = filename or self.filename
-        if filename.is_file():
+        if not filename.is_file():
+            return
+        # only parse the file again if it has changed since we last read it
+        stat = filename.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = _parsed_files.get(filename)
+        if cached is None or cached[0] != key:
             with open(filename) as f:
                 try:
-                    self.update(yaml.safe_load(f))
+                    cached = (key, _yaml_load(f))
                 except Exception:
-                    pass
+                    cached = (key, None)
+            _parsed_files[filename] = cached
+        try:
+            self.update(copy.deepcopy(cached[1]))
+        except Exception:
+            pass
 
     def get_logger(self) -> logging.Logger:
         """Setup the location and logging for this package."""
+        global _logger
+
+        # Only setup the logger again if the logfile has changed
+        if _logger is not None and _logger[0] == self["logfile"]:
+            return _logger[1]
 
         # Where will the log be written?
         log_file = Path(self["logfile"]).expanduser()
@@ -202,8 +254,14 @@ class Config(dict):
 
         # This is probably wrong, but when I log from my logger it logs from parent also
         logger.parent.handlers = []
+        _logger = (self["logfile"], logger)
         return logger
 
 
-conf = Config()
-conf.reload_all()
+def __getattr__(name: str):
+    # the global configuration is only created, and its file read, when first used
+    if name == "conf":
+        conf = Config()
+        globals()["conf"] = conf
+        return conf
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,8 +1,13 @@
 """A Globus-based ESGF1 style index."""
 
-import re
+import math
+import threading
 import time
+from collections import Counter
+from collections.abc import Iterator
 from datetime import datetime
+from functools import partial
+from multiprocessing.pool import ThreadPool
 from pathlib import Path
 from typing import Any
 
@@ -13,20 +18,52 @@ from globus_sdk import (
     RefreshTokenAuthorizer,
     SearchClient,
     SearchQuery,
+    SearchScrollQuery,
     TransferAPIError,
     TransferClient,
     TransferData,
 )
 from globus_sdk.tokenstorage import SimpleJSONFileAdapter
+from requests.adapters import HTTPAdapter
 
 import intake_esgf
 import intake_esgf.base as base
 from intake_esgf.exceptions import GlobusTransferError
-from intake_esgf.projects import get_project_facets
 
 CLIENT_ID = "81a13009-8326-456e-a487-2d1557d8eb11"  # intake-esgf
 
 
+_search_client = None
+_search_client_lock = threading.Lock()
+_transfer_client = None
+
+
+def get_search_client() -> SearchClient:
+    """
+    Return the Globus search client shared by the indices.
+
+    All indices are served by the same Globus Search service, so sharing one client
+    (and its HTTP session) keeps the connection alive across indices, pages and calls.
+    """
+    global _search_client
+    with _search_client_lock:
+        if _search_client is None:
+            _search_client = SearchClient()
+            # pages are fetched concurrently for each index, so widen the pool
+            _search_client.transport.session.mount(
+                "https://", HTTPAdapter(pool_maxsize=32)
+            )
+    return _search_client
+
+
+def _iter_contents(
+    response: GlobusHTTPResponse,
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Yield the subject and content of each entry in the search response."""
+    for g in response["gmeta"]:
+        yield g["subject"], g["entries"][0]["content"]
+
+
 class GlobusESGFIndex:
     GLOBUS_INDEX_IDS = {
         "anl-dev": "d927e2d9-ccdb-48e4-b05d-adbc3d97bbc5",
@@ -35,14 +72,60 @@ class GlobusESGFIndex:
 
     def __init__(self, index_id="anl-dev"):
         self.repr = f"GlobusESGFIndex('{index_id}')"
+        # the ALCF index encodes booleans as strings
+        self.bool_as_str = index_id == "anl-dev"
         if index_id in GlobusESGFIndex.GLOBUS_INDEX_IDS:
             index_id = GlobusESGFIndex.GLOBUS_INDEX_IDS[index_id]
         self.index_id = index_id
-        self.client = SearchClient()
+        self.client = get_search_client()
 
     def __repr__(self):
         return self.repr
 
+    def _post_search_pages(self, query: SearchQuery) -> Iterator[GlobusHTTPResponse]:
+        """Yield all pages of results of the query.
+
+        The first page tells us how many results there are, after which the remaining
+        results are split into larger pages, one per thread, and requested
+        concurrently. Pages are yielded in order as they arrive so that each may be
+        released once read. Globus limits offset paging to the first 10000 results, so
+        larger results are instead scrolled through sequentially using a marker.
+
+        """
+        page_size = 1000
+        first = self.client.post_search(self.index_id, query, limit=page_size)
+        total = first["total"]
+        if total > 10000:
+            scroll = SearchScrollQuery(
+                query["q"],
+                limit=page_size,
+                additional_fields={"filters": query.get("filters", [])},
+            )
+            yield from self.client.paginated.scroll(self.index_id, scroll)
+            return
+        if total <= page_size:
+            yield first
+            return
+        num_pages = min(
+            math.ceil((total - page_size) / page_size), intake_esgf.conf["num_threads"]
+        )
+        remaining_size = math.ceil((total - page_size) / num_pages)
+        offsets = list(range(page_size, total, remaining_size))
+        with ThreadPool(len(offsets)) as pool:
+            # request the remaining pages while the first is being read, the last
+            # only up to the total so that it stays within the offset paging window
+            pages = pool.imap(
+                lambda offset: self.client.post_search(
+                    self.index_id,
+                    query,
+                    offset=offset,
+                    limit=min(remaining_size, total - offset),
+                ),
+                offsets,
+            )
+            yield first
+            yield from pages
+
     def search(self, **search: str | list[str]) -> pd.DataFrame:
         """Search the index and return as a pandas dataframe.
 
@@ -53,11 +136,11 @@ class GlobusESGFIndex:
         entries.
 
         """
-        # the ALCF index encodes booleans as strings
-        if "anl-dev" in self.repr:
-            for key, val in search.items():
-                if isinstance(val, bool):
-                    search[key] = str(val)
+        if self.bool_as_str:
+            search = {
+                key: str(val) if isinstance(val, bool) else val
+                for key, val in search.items()
+            }
 
         # build up the query and search
         query_data = SearchQuery("")
@@ -66,51 +149,38 @@ class GlobusESGFIndex:
                 key, val if isinstance(val, list) else [val], type="match_any"
             )
 
-        facets = get_project_facets(search) + intake_esgf.conf.get(
-            "additional_df_cols", []
-        )
-        if "project" not in facets:
-            facets = ["project"] + facets
-
-        response_time = time.time()
-        sc = SearchClient()
-        paginator = sc.paginated.post_search(self.index_id, query_data)
-        paginator.limit = 1000
-        df = []
-        for response in paginator:
-            for g in response["gmeta"]:
-                content = g["entries"][0]["content"]
-                record = {
-                    facet: (
-                        content[facet][0]
-                        if isinstance(content[facet], list)
-                        else content[facet]
-                    )
-                    for facet in facets
-                    if facet in content
-                }
-                record["project"] = content["project"][0]
-                record["id"] = g["subject"]
-                if record["project"] == "CMIP5":
-                    variables = search["variable"] if "variable" in search else []
-                    if not isinstance(variables, list):
-                        variables = [variables]
-                    record = base.expand_cmip5_record(
-                        variables,
-                        content["variable"],
-                        record,
-                    )
-                df += record if isinstance(record, list) else [record]
-        df = pd.DataFrame(df)
-        response_time = time.time() - response_time
+        facets = base.get_dataframe_columns(search)
+
+        # build the dataframe by column, facets missing from every record are dropped
+        df = {column: [] for column in facets + ["id"]}
+        variables = search["variable"] if "variable" in search else []
+        if not isinstance(variables, list):
+            variables = [variables]
+        # time waiting on the requests apart from building the dataframe
+        response_time = parse_time = 0.0
+        start = time.perf_counter()
+        for page in self._post_search_pages(query_data):
+            response_time += time.perf_counter() - start
+            start = time.perf_counter()
+            base.add_records_to_columns(df, _iter_contents(page), variables)
+            parse_time += time.perf_counter() - start
+            start = time.perf_counter()
+        df = base.columns_to_dataframe(df)
+        parse_time += time.perf_counter() - start
         logger = intake_esgf.conf.get_logger()
-        logger.info(f"└─{self} results={len(df)} {response_time=:.2f}")
+        logger.info(
+            f"└─{self} results={len(df)} {response_time=:.2f} {parse_time=:.2f}"
+        )
         return df
 
     def get_file_info(self, dataset_ids: list[str], **facets) -> dict[str, Any]:
         """Get file information for the given datasets."""
-        response_time = time.time()
-        sc = SearchClient()
+        return list(self.iter_file_info(dataset_ids, **facets))
+
+    def iter_file_info(
+        self, dataset_ids: list[str], **facets
+    ) -> Iterator[dict[str, Any]]:
+        """Yield file information for the given datasets as each page arrives."""
         query = (
             SearchQuery("")
             .add_filter("type", ["File"])
@@ -120,68 +190,87 @@ class GlobusESGFIndex:
             query.add_filter(
                 facet, val if isinstance(val, list) else [val], type="match_any"
             )
-        paginator = sc.paginated.post_search(self.index_id, query)
-        paginator.limit = 1000
-        infos = []
-        for response in paginator:
-            for g in response.get("gmeta"):
-                assert len(g["entries"]) == 1
-                content = g["entries"][0]["content"]
+        num_files = 0
+        directories = {}
+        response_time = parse_time = 0.0
+        start = time.perf_counter()
+        for page in self._post_search_pages(query):
+            response_time += time.perf_counter() - start
+            start = time.perf_counter()
+            infos = []
+            for _, content in _iter_contents(page):
                 info = {
                     "dataset_id": content["dataset_id"],
                     "checksum_type": content["checksum_type"][0],
                     "checksum": content["checksum"][0],
                     "size": content["size"],
-                    "HTTPServer": [
-                        url.split("|")[0]
-                        for url in content["url"]
-                        if "HTTPServer" in url
-                    ],
-                    "OPENDAP": [
-                        url.split("|")[0].replace(".html", "")
-                        for url in content["url"]
-                        if "OPENDAP" in url
-                    ],
-                    "Globus": [
-                        url.split("|")[0] for url in content["url"] if "Globus" in url
-                    ],
+                    "HTTPServer": [],
+                    "OPENDAP": [],
+                    "Globus": [],
                 }
-                info["path"] = base.get_content_path(content)
+                # classify the links in a single pass, entries are 'link|mime|type'
+                for entry in content["url"]:
+                    link, _, link_type = entry.rpartition("|")
+                    link = link.partition("|")[0]
+                    if link_type == "OPENDAP":
+                        link = link.replace(".html", "")
+                    if link_type in info:
+                        info[link_type].append(link)
+                info["path"] = base.get_content_path(content, directories)
                 infos.append(info)
-        response_time = time.time() - response_time
+            parse_time += time.perf_counter() - start
+            num_files += len(infos)
+            yield from infos
+            start = time.perf_counter()
         logger = intake_esgf.conf.get_logger()
-        logger.info(f"└─{self} results={len(infos)} {response_time=:.2f}")
-        return infos
+        logger.info(
+            f"└─{self} results={num_files} {response_time=:.2f} {parse_time=:.2f}"
+        )
 
     def from_tracking_ids(self, tracking_ids: list[str]) -> pd.DataFrame:
-        response = SearchClient().post_search(
-            self.index_id,
-            SearchQuery("").add_filter("tracking_id", tracking_ids, type="match_any"),
-        )
+        def _search_chunk(chunk):
+            query = SearchQuery("").add_filter("tracking_id", chunk, type="match_any")
+            return self._post_search_pages(query)
+
+        # queries are posted, so each may hold many ids
+        responses = base.search_in_chunks(_search_chunk, tracking_ids, 200)
+        columns = {}  # the dataframe columns of each project
         df = []
-        for g in response["gmeta"]:
-            content = g["entries"][0]["content"]
-            facets = get_project_facets(content)
-            if "project" not in facets:
-                facets = ["project"] + facets
-            record = {
-                facet: (
-                    content[facet][0]
-                    if isinstance(content[facet], list)
-                    else content[facet]
-                )
-                for facet in facets
-                if facet in content
-            }
-            record["project"] = content["project"][0]
-            record["id"] = content["dataset_id"]
-            df.append(record)
+        for response in responses:
+            for _, content in _iter_contents(response):
+                project = content["project"][0]
+                if project not in columns:
+                    columns[project] = base.get_dataframe_columns(content)
+                facets = columns[project]
+                record = {
+                    facet: value[0] if type(value) is list else value
+                    for facet in facets
+                    if (value := content.get(facet)) is not None
+                }
+                record["project"] = project
+                record["id"] = content["dataset_id"]
+                df.append(record)
         df = pd.DataFrame(df)
         return df
 
 
 def variable_info(query: str, project: str = "CMIP6") -> pd.DataFrame:
-    """Return a dataframe with variable information from a query."""
+    """Return a dataframe with variable information from a query.
+
+    The variable information rarely changes, so results are cached on disk, by default
+    for a day, see the `variable_info_cache_hours` option.
+
+    """
+    return base.get_cached_dataframe(
+        "variable_info",
+        {"query": query, "project": project},
+        intake_esgf.conf["variable_info_cache_hours"],
+        partial(_query_variable_info, query, project),
+    )
+
+
+def _query_variable_info(query: str, project: str) -> pd.DataFrame:
+    """Query the index for variable information."""
     # first we populate a list of related veriables
     q = (
         SearchQuery(query)
@@ -191,7 +280,9 @@ def variable_info(query: str, project: str = "CMIP6") -> pd.DataFrame:
         .add_facet("variable", "variable")
         .set_limit(0)
     )
-    response = SearchClient().post_search("ea4595f4-7b71-4da7-a1f0-e3f5d8f7f062", q)
+    response = get_search_client().post_search(
+        "ea4595f4-7b71-4da7-a1f0-e3f5d8f7f062", q
+    )
     variables = list(
         set(
             [
@@ -205,29 +296,53 @@ def variable_info(query: str, project: str = "CMIP6") -> pd.DataFrame:
     var_facet = [fr["name"] for fr in response.data["facet_results"] if fr["buckets"]]
     assert var_facet
     var_facet = var_facet[0]
-    # then we loop through them and extract information for the user
-    df = []
-    for v in variables:
+
+    # then we query them and extract information for the user
+    def _query_variables(values: list[str], limit: int) -> GlobusHTTPResponse:
         q = (
             SearchQuery("")
             .add_filter("type", ["Dataset"])
             .add_filter("project", [project])
-            .add_filter(var_facet, [v])  # need to abstract this
-            .set_limit(1)
+            .add_filter(var_facet, values, type="match_any")  # need to abstract this
+            .set_limit(limit)
         )
-        response = SearchClient().post_search("ea4595f4-7b71-4da7-a1f0-e3f5d8f7f062", q)
-        for doc in response.get("gmeta"):
-            content = doc["entries"][0]["content"]
+        return get_search_client().post_search(
+            "ea4595f4-7b71-4da7-a1f0-e3f5d8f7f062", q
+        )
+
+    df = {}
+
+    def _add_records(response: GlobusHTTPResponse) -> None:
+        for _, content in _iter_contents(response):
+            if content[var_facet][0] in df:
+                continue
             columns = [var_facet]
             columns += [key for key in content if "variable_" in key]
             columns += [key for key in content if "name" in key]
-            df.append({key: content[key][0] for key in set(columns)})
-    df = pd.DataFrame(df).sort_values(var_facet).set_index(var_facet)
+            df[content[var_facet][0]] = {key: content[key][0] for key in set(columns)}
+
+    # a single query usually finds an example of most variables, only those still
+    # missing are queried individually
+    _add_records(_query_variables(variables, 1000))
+    missing = [v for v in variables if v not in df]
+    if missing:
+        with ThreadPool(min(len(missing), intake_esgf.conf["num_threads"])) as pool:
+            for response in pool.map(lambda v: _query_variables([v], 1), missing):
+                _add_records(response)
+    df = pd.DataFrame(list(df.values())).sort_values(var_facet).set_index(var_facet)
     return df
 
 
 def get_authorized_transfer_client() -> TransferClient:
-    """Return a transfer client authorized to make transfers."""
+    """Return a transfer client authorized to make transfers.
+
+    The client is created once and reused, its authorizer refreshes the access token
+    when needed.
+
+    """
+    global _transfer_client
+    if _transfer_client is not None:
+        return _transfer_client
     config_path = Path.home() / ".config" / "intake-esgf"
     token_adapter = SimpleJSONFileAdapter(config_path / "tokens.json")
     client = NativeAppAuthClient(CLIENT_ID)
@@ -259,8 +374,8 @@ You will have to login (or be logged in) to your Globus account. Globus will als
         expires_at=tokens["expires_at_seconds"],
         on_refresh=token_adapter.on_refresh,
     )
-    transfer_client = TransferClient(authorizer=authorizer)
-    return transfer_client
+    _transfer_client = TransferClient(authorizer=authorizer)
+    return _transfer_client
 
 
 def create_globus_transfer(
@@ -290,30 +405,28 @@ def create_globus_transfer(
 
     # we want to launch as few tasks as we can, so let's see how many files are
     # available on each endpoint.
-    active_endpoints = {}
+    active_endpoints = Counter()
+    endpoint_paths = {}  # the path of each file on the endpoints which host it
     for i, info in enumerate(infos):
         infos[i]["added"] = False  # has this file been added to a task?
-        for uuid in info["active_endpoints"]:
-            if uuid not in active_endpoints:
-                active_endpoints[uuid] = 0
-            active_endpoints[uuid] += 1
+        active_endpoints.update(info["active_endpoints"])
+        for link in info["Globus"]:
+            m = base.GLOBUS_LINK_RE.search(link)
+            if not m:
+                continue
+            endpoint_paths.setdefault(m.group(1), {}).setdefault(i, m.group(2))
 
     # create globus transfers, starting with the endpoint that has the most files
+    globus_path = Path(globus_path)
     tasks = []
-    for source_uuid in sorted(active_endpoints, key=active_endpoints.get, reverse=True):
+    for source_uuid, _ in active_endpoints.most_common():
         task_data = TransferData(
             source_endpoint=source_uuid, destination_endpoint=globus_endpoint
         )
-        for i, info in enumerate(infos):
-            if info["added"]:
+        for i, source_path in endpoint_paths.get(source_uuid, {}).items():
+            if infos[i]["added"]:
                 continue
-            possible = [g for g in info["Globus"] if source_uuid in g]
-            if not possible:
-                continue
-            m = re.search(r"globus:/*([a-z0-9\-]+)/(.*)", possible[0])
-            if not m:
-                continue
-            task_data.add_item(m.group(2), str(Path(globus_path) / info["path"]))
+            task_data.add_item(source_path, str(globus_path / infos[i]["path"]))
             infos[i]["added"] = True
 
         # only submit the transfer if there is data
@@ -322,7 +435,7 @@ def create_globus_transfer(
             tasks.append(task_doc)
 
     # make sure everything was submitted
-    assert min([info["added"] for info in infos]) == 1
+    assert all(info["added"] for info in infos), "not all files were added to a task"
     return tasks
 
 
@@ -332,8 +445,11 @@ def monitor_globus_transfer(tasks: list[GlobusHTTPResponse]) -> None:
 
 
     """
+    if not tasks:
+        return
     client = get_authorized_transfer_client()
-    for task_doc in tasks:
+
+    def _wait_for_task(task_doc):
         time_interval = 5.0
         response = client.get_task(task_doc["task_id"])
         while response["status"] == "ACTIVE":
@@ -342,3 +458,7 @@ def monitor_globus_transfer(tasks: list[GlobusHTTPResponse]) -> None:
             response = client.get_task(task_doc["task_id"])
         if response.data["status"] != "SUCCEEDED":
             raise GlobusTransferError(response)
+
+    # the tasks are independent, so poll them at the same time
+    with ThreadPool(len(tasks)) as pool:
+        pool.map(_wait_for_task, tasks)
@@ -1,33 +1,56 @@
 """A ESGF1 Solr index class."""
 
 import time
+from collections.abc import Iterator
+from multiprocessing.pool import ThreadPool
 from typing import Any
 
 import pandas as pd
-import requests
 
 import intake_esgf
 import intake_esgf.base as base
 from intake_esgf.exceptions import NoSearchResults
-from intake_esgf.projects import get_project_facets
 
 
 def esg_search(base_url, **search):
-    """Yields paginated responses using the ESGF REST API."""
+    """Yields paginated responses using the ESGF REST API.
+
+    The first response tells us how many results there are, after which the remaining
+    pages are requested concurrently and yielded in order. Requests go through the
+    shared session so that pages reuse the pooled connections to the index node.
+
+    """
     if "format" not in search:
         search["format"] = "application/solr+json"
-    offset = search.get("offset", 0)
-    limit = search.get("limit", 10)
-    total = offset + limit + 1
-    while (offset + limit) < total:
-        response = requests.get(f"{base_url}/esg-search/search", params=search)
+    # the server default of 10 results per page costs many more round-trips
+    if "limit" not in search:
+        search["limit"] = 1000
+
+    def _get_page(params):
+        response = base.get_session().get(
+            f"{base_url}/esg-search/search", params=params
+        )
         response.raise_for_status()
-        response = response.json()
+        return response.json()
+
+    response = _get_page(search)
+    limit = len(response["response"]["docs"])
+    total = response["response"]["numFound"]
+    offset = response["response"]["start"]
+    pages = []
+    if limit:
+        pages = [
+            dict(search, offset=page_offset)
+            for page_offset in range(offset + limit, total, limit)
+        ]
+    if not pages:
+        yield response
+        return
+    with ThreadPool(min(len(pages), intake_esgf.conf["num_threads"])) as pool:
+        # request the remaining pages while the first is being read
+        responses = pool.imap(_get_page, pages)
         yield response
-        limit = len(response["response"]["docs"])
-        total = response["response"]["numFound"]
-        offset = response["response"]["start"]
-        search["offset"] = offset + limit
+        yield from responses
 
 
 class SolrESGFIndex:
@@ -42,61 +65,64 @@ class SolrESGFIndex:
     def search(self, **search: str | list[str]) -> pd.DataFrame:
         logger = intake_esgf.conf.get_logger()
         search["distrib"] = search["distrib"] if "distrib" in search else self.distrib
-        facets = get_project_facets(search) + intake_esgf.conf.get(
-            "additional_df_cols", []
-        )
-        if "project" not in facets:
-            facets = ["project"] + facets
-        response_time = time.time()
-        df = []
+        facets = base.get_dataframe_columns(search)
+        # build the dataframe by column, facets missing from every record are dropped
+        df = {column: [] for column in facets + ["id"]}
+        # only transfer the fields we keep, CMIP5 records also need their variables
+        search["fields"] = ",".join(sorted(set(df) | {"variable"}))
+        variables = search["variable"] if "variable" in search else []
+        if not isinstance(variables, list):
+            variables = [variables]
+        # time waiting on the requests apart from building the dataframe
+        response_time = parse_time = 0.0
+        start = time.perf_counter()
         for response in esg_search(self.url, **search):
+            response_time += time.perf_counter() - start
+            start = time.perf_counter()
             response = response["response"]
             if not response["numFound"]:
                 logger.info(f"└─{self} no results")
                 raise NoSearchResults
-            for doc in response["docs"]:
-                record = {
-                    facet: doc[facet][0] if isinstance(doc[facet], list) else doc[facet]
-                    for facet in facets
-                    if facet in doc
-                }
-                record["project"] = doc["project"][0]
-                record["id"] = doc["id"]
-                if record["project"] == "CMIP5":
-                    variables = search["variable"] if "variable" in search else []
-                    if not isinstance(variables, list):
-                        variables = [variables]
-                    record = base.expand_cmip5_record(
-                        variables,
-                        doc["variable"],
-                        record,
-                    )
-                df += record if isinstance(record, list) else [record]
-        df = pd.DataFrame(df)
-        response_time = time.time() - response_time
+            base.add_records_to_columns(
+                df, ((doc["id"], doc) for doc in response["docs"]), variables
+            )
+            parse_time += time.perf_counter() - start
+            start = time.perf_counter()
+        df = base.columns_to_dataframe(df)
+        parse_time += time.perf_counter() - start
         logger = intake_esgf.conf.get_logger()
-        logger.info(f"└─{self} results={len(df)} {response_time=:.2f}")
+        logger.info(
+            f"└─{self} results={len(df)} {response_time=:.2f} {parse_time=:.2f}"
+        )
         return df
 
     def from_tracking_ids(self, tracking_ids: list[str]) -> pd.DataFrame:
         logger = intake_esgf.conf.get_logger()
         total_time = time.time()
+
+        def _search_chunk(chunk):
+            return esg_search(self.url, type="File", tracking_id=chunk)
+
+        # the ids are sent in the url, which servers limit to about 8 KB, and each
+        # encoded id takes about 65 bytes
+        responses = base.search_in_chunks(_search_chunk, tracking_ids, 50)
+        if not any(response["response"]["numFound"] for response in responses):
+            logger.info(f"└─{self} no results")
+            raise NoSearchResults
+        columns = {}  # the dataframe columns of each project
         df = []
-        for response in esg_search(self.url, type="File", tracking_id=tracking_ids):
-            response = response["response"]
-            if not response["numFound"]:
-                logger.info(f"└─{self} no results")
-                raise NoSearchResults
-            for doc in response["docs"]:
-                facets = get_project_facets(doc)
-                if "project" not in facets:
-                    facets = ["project"] + facets
+        for response in responses:
+            for doc in response["response"]["docs"]:
+                project = doc["project"][0]
+                if project not in columns:
+                    columns[project] = base.get_dataframe_columns(doc)
+                facets = columns[project]
                 record = {
-                    facet: doc[facet][0] if isinstance(doc[facet], list) else doc[facet]
+                    facet: value[0] if type(value) is list else value
                     for facet in facets
-                    if facet in doc
+                    if (value := doc.get(facet)) is not None
                 }
-                record["project"] = doc["project"][0]
+                record["project"] = project
                 record["id"] = doc["id"]
                 df.append(record)
         df = pd.DataFrame(df)
@@ -105,8 +131,12 @@ class SolrESGFIndex:
         return df
 
     def get_file_info(self, dataset_ids: list[str], **facets) -> dict[str, Any]:
+        return list(self.iter_file_info(dataset_ids, **facets))
+
+    def iter_file_info(
+        self, dataset_ids: list[str], **facets
+    ) -> Iterator[dict[str, Any]]:
         logger = intake_esgf.conf.get_logger()
-        response_time = time.time()
         search = dict(
             type="File",
             latest=True,
@@ -115,25 +145,33 @@ class SolrESGFIndex:
             dataset_id=dataset_ids,
         )
         search.update(facets)
-        infos = []
+        num_files = 0
+        directories = {}
+        response_time = parse_time = 0.0
+        start = time.perf_counter()
         for response in esg_search(self.url, **search):
+            response_time += time.perf_counter() - start
+            start = time.perf_counter()
             response = response["response"]
             if not response["numFound"]:
                 logger.info(f"└─{self} no results")
                 raise NoSearchResults
+            infos = []
             for doc in response["docs"]:
                 info = {}
                 info["dataset_id"] = doc["dataset_id"]
                 info["checksum_type"] = doc["checksum_type"][0]
                 info["checksum"] = doc["checksum"][0]
                 info["size"] = doc["size"]
-                info["path"] = base.get_content_path(doc)
+                info["path"] = base.get_content_path(doc, directories)
                 for entry in doc["url"]:
                     link, _, link_type = entry.split("|")
-                    if link_type not in info:
-                        info[link_type] = []
-                    info[link_type].append(link)
+                    info.setdefault(link_type, []).append(link)
                 infos.append(info)
-        response_time = time.time() - response_time
-        logger.info(f"└─{self} results={len(infos)} {response_time=:.2f}")
-        return infos
+            parse_time += time.perf_counter() - start
+            num_files += len(infos)
+            yield from infos
+            start = time.perf_counter()
+        logger.info(
+            f"└─{self} results={num_files} {response_time=:.2f} {parse_time=:.2f}"
+        )
@@ -3,6 +3,7 @@
 import sqlite3
 from pathlib import Path
 from typing import Literal
+from urllib.parse import urlsplit
 
 import numpy as np
 import pandas as pd
@@ -81,7 +82,21 @@ def get_download_rate_dataframe(
     return df
 
 
-def sort_download_links(link: str, df_rate: pd.DataFrame) -> float:
+def get_download_rates(path: Path) -> dict[str, float]:
+    """Get the average download rate of each host.
+
+    Parameters
+    ----------
+    path
+        The full path of the database file.
+    """
+    df = get_download_rate_dataframe(path)
+    if "rate" not in df:
+        return {}
+    return df["rate"].to_dict()
+
+
+def sort_download_links(link: str, rates: dict[str, float]) -> float:
     """Return the average download rate for the given link.
 
     This function is to be used to sort the list of links in terms of what is fastest
@@ -93,16 +108,16 @@ def sort_download_links(link: str, df_rate: pd.DataFrame) -> float:
     ----------
     link
         The link to the file to download.
-    df_rate
-        The dataframe whose indices are hosts and contains a `rate` column.
+    rates
+        The average download rates keyed by host, see `get_download_rates`.
 
     """
-    if not len(df_rate):
+    if not rates:
         return np.random.rand(1)[0]
-    host = link[: link.index("/", 10)].replace("http://", "").replace("https://", "")
-    if host not in df_rate.index:
-        return df_rate["rate"].max() + np.random.rand(1)[0]
-    return df_rate.loc[host, "rate"]
+    host = urlsplit(link).netloc
+    if host not in rates:
+        return max(rates.values()) + np.random.rand(1)[0]
+    return rates[host]
 
 
 def sort_globus_endpoints(uuid: str, df_rate: pd.DataFrame) -> float:
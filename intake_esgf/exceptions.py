@@ -1,8 +1,10 @@
 """Exceptions for intake-esgf."""
 
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from globus_sdk import GlobusHTTPResponse
+if TYPE_CHECKING:
+    from globus_sdk import GlobusHTTPResponse
 
 
 class IntakeESGFException(Exception):
@@ -58,7 +60,7 @@ class DatasetInitError(IntakeESGFException):
 class GlobusTransferError(IntakeESGFException):
     """The globus task return a non-successful status."""
 
-    def __init__(self, task_doc: GlobusHTTPResponse):
+    def __init__(self, task_doc: "GlobusHTTPResponse"):
         self.task_doc = task_doc
 
     def __str__(self):
@@ -1,10 +1,15 @@
+import hashlib
+import os
 from pathlib import Path
 
+import pandas as pd
 import pytest
 
 import intake_esgf
+import intake_esgf.base as base
 from intake_esgf import ESGFCatalog
-from intake_esgf.base import partition_infos
+from intake_esgf.base import combine_results, get_content_path, partition_infos
+from intake_esgf.database import create_download_database
 from intake_esgf.exceptions import NoSearchResults
 
 SOLR_TEST = "esgf-node.llnl.gov"
@@ -196,3 +201,249 @@ def test_partition_infos_globus():
     infos_, _ = partition_infos(infos, False, True)
     assert max([len(infos_[p]) for p in ["exist", "stream", "https"]]) == 0
     assert len(infos_["globus"]) == 1
+
+
+def test_combine_results():
+    facets = dict(
+        mip_era="CMIP6",
+        activity_drs="CMIP",
+        institution_id="CCCma",
+        experiment_id="historical",
+        member_id="r1i1p1f1",
+        table_id="Amon",
+        grid_label="gn",
+        version="20190429",
+    )
+
+    def _record(source_id, variable_id, data_node):
+        record = dict(
+            project="CMIP6",
+            source_id=source_id,
+            variable_id=variable_id,
+            data_node=data_node,
+            **facets,
+        )
+        record["id"] = (
+            f"CMIP6.CMIP.CCCma.{source_id}.historical.r1i1p1f1.Amon.{variable_id}.gn"
+            f".v20190429|{data_node}"
+        )
+        return record
+
+    df = combine_results(
+        [
+            pd.DataFrame(
+                [
+                    _record("CanESM5", "tas", "node1"),
+                    _record("CanESM5", "pr", "node1"),
+                ]
+            ),
+            pd.DataFrame(
+                [
+                    _record("CanESM5", "tas", "node2"),
+                    _record("CanESM5", "tas", "node2"),
+                ]
+            ),
+        ]
+    )
+    assert len(df) == 2
+    assert "data_node" not in df.columns
+    ids = dict(zip(df["variable_id"], df["id"]))
+    assert [i.split("|")[-1] for i in ids["tas"]] == ["node1", "node2"]
+    assert len(ids["pr"]) == 1
+
+
+class _FakeResponse:
+    def __init__(self, data: bytes, status_code: int):
+        self.data = data
+        self.status_code = status_code
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size: int):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i : i + chunk_size]
+
+
+class _FakeSession:
+    """Serves the data, and byte ranges of it if `ranges` is enabled."""
+
+    def __init__(self, data: bytes, ranges: bool):
+        self.data = data
+        self.ranges = ranges
+        self.requested = []
+
+    def get(self, url, headers=None, **kwargs):
+        byte_range = (headers or {}).get("Range")
+        self.requested.append(byte_range)
+        if byte_range is None or not self.ranges:
+            return _FakeResponse(self.data, 200)
+        start, end = map(int, byte_range.removeprefix("bytes=").split("-"))
+        return _FakeResponse(self.data[start : end + 1], 206)
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+def test_download_and_verify(tmp_path, monkeypatch, ranges):
+    data = os.urandom(3 * 1024 * 1024 + 7)
+    session = _FakeSession(data, ranges)
+    monkeypatch.setattr(base, "get_session", lambda: session)
+    monkeypatch.setattr(base, "DOWNLOAD_RANGE_MIN_SIZE", 1024)
+    download_db = tmp_path / "download.db"
+    create_download_database(download_db)
+    url = "https://host/file.nc"
+    sha = hashlib.sha256(data).hexdigest()
+
+    local_file = tmp_path / "file.nc"
+    base.download_and_verify(
+        url, local_file, sha, "SHA256", len(data), download_db, quiet=True
+    )
+    assert local_file.read_bytes() == data
+    assert not local_file.with_name("file.nc.part").exists()
+    # the probe asks for a single byte, then the parts are fetched if supported
+    assert session.requested[0] == "bytes=0-0"
+    num_parts = base.DOWNLOAD_RANGE_PARTS if ranges else 0
+    assert len([r for r in session.requested[1:] if r is not None]) == num_parts
+
+    # a bad hash leaves nothing behind
+    bad_file = tmp_path / "bad.nc"
+    with pytest.raises(ValueError):
+        base.download_and_verify(
+            url, bad_file, "0" * 64, "SHA256", len(data), download_db, quiet=True
+        )
+    assert not bad_file.exists()
+    assert not bad_file.with_name("bad.nc.part").exists()
+
+
+def test_truncated_local_file(tmp_path, monkeypatch):
+    data = os.urandom(1024)
+    session = _FakeSession(data, False)
+    monkeypatch.setattr(base, "get_session", lambda: session)
+    download_db = tmp_path / "download.db"
+    create_download_database(download_db)
+    local_cache = tmp_path / "cache"
+    info = {
+        "key": "dataset1",
+        "path": Path("file1.nc"),
+        "HTTPServer": ["https://host/file1.nc"],
+        "checksum": hashlib.sha256(data).hexdigest(),
+        "checksum_type": "SHA256",
+        "size": len(data),
+    }
+    local_cache.mkdir()
+    (local_cache / "file1.nc").write_bytes(data[:100])
+    with intake_esgf.conf.set(esg_dataroot=[], local_cache=[str(local_cache)]):
+        # a truncated file is not used but downloaded again
+        infos_, _ = partition_infos([info], False, False)
+        assert len(infos_["exist"]) == 0
+        assert len(infos_["https"]) == 1
+        key, path = base.parallel_download(info, [local_cache], download_db, [])
+        assert path.read_bytes() == data
+        infos_, ds = partition_infos([info], False, False)
+        assert len(infos_["exist"]) == 1
+        assert ds == {"dataset1": [local_cache / "file1.nc"]}
+
+
+def test_content_path_per_file_facets():
+    template = "%(root)s/%(project)s/%(variable)s/%(version)s"
+
+    def _content(variable: str):
+        return {
+            "dataset_id": "cmip5.output1.CCCma.CanESM2.v20120410|node",
+            "directory_format_template_": [template],
+            "project": ["CMIP5"],
+            "variable": [variable],
+            "title": f"{variable}.nc",
+        }
+
+    # files of one dataset whose template facets differ do not share a directory
+    directories = {}
+    paths = [get_content_path(_content(v), directories) for v in ["tas", "pr"]]
+    assert paths == [
+        Path("CMIP5/tas/v20120410/tas.nc"),
+        Path("CMIP5/pr/v20120410/pr.nc"),
+    ]
+    assert paths == [get_content_path(_content(v)) for v in ["tas", "pr"]]
+
+
+def _cache_query(calls: list):
+    def _query():
+        calls.append(None)
+        return pd.DataFrame({"source_id": ["CanESM5", "UKESM1-0-LL"], "size": [1, 2]})
+
+    return _query
+
+
+def test_cached_dataframe(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    calls = []
+    query = _cache_query(calls)
+    df = base.get_cached_dataframe("test", {"variable_id": "tas"}, 1, query)
+    cached = base.get_cached_dataframe("test", {"variable_id": "tas"}, 1, query)
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(df, cached)
+    # a different key and a refresh both run the query
+    base.get_cached_dataframe("test", {"variable_id": "pr"}, 1, query)
+    base.get_cached_dataframe("test", {"variable_id": "tas"}, 1, query, refresh=True)
+    assert len(calls) == 3
+
+
+def test_cached_dataframe_expiry(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    calls = []
+    query = _cache_query(calls)
+    base.get_cached_dataframe("test", {"variable_id": "tas"}, 1, query)
+    (cache_file,) = (tmp_path / ".cache/intake-esgf/test").iterdir()
+    os.utime(cache_file, (0, 0))
+    # expired results are queried again
+    base.get_cached_dataframe("test", {"variable_id": "tas"}, 1, query)
+    assert len(calls) == 2
+    # and removed when other results are stored
+    os.utime(cache_file, (0, 0))
+    base.get_cached_dataframe("test", {"variable_id": "pr"}, 1, query)
+    assert not cache_file.exists()
+
+
+def test_cached_dataframe_disabled(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    calls = []
+    query = _cache_query(calls)
+    base.get_cached_dataframe("test", {"variable_id": "tas"}, 0, query)
+    base.get_cached_dataframe("test", {"variable_id": "tas"}, 0, query)
+    assert len(calls) == 2
+    assert not (tmp_path / ".cache").exists()
+
+
+def test_cached_dataframe_corrupt(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    calls = []
+    query = _cache_query(calls)
+    df = base.get_cached_dataframe("test", {"variable_id": "tas"}, 1, query)
+    (cache_file,) = (tmp_path / ".cache/intake-esgf/test").iterdir()
+    cache_file.write_text("{not json")
+    cached = base.get_cached_dataframe("test", {"variable_id": "tas"}, 1, query)
+    assert len(calls) == 2
+    pd.testing.assert_frame_equal(df, cached)
+
+
+def test_cached_dataframe_empty(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    calls = []
+    query = _cache_query(calls)
+    base.get_cached_dataframe("test", {"variable_id": "tas"}, 1, query)
+
+    def _empty():
+        calls.append(None)
+        return pd.DataFrame([])
+
+    # an empty refresh removes the cached result and is not cached itself
+    df = base.get_cached_dataframe("test", {"variable_id": "tas"}, 1, _empty, True)
+    assert df.empty
+    assert not list((tmp_path / ".cache/intake-esgf/test").iterdir())
+    base.get_cached_dataframe("test", {"variable_id": "tas"}, 1, _empty)
+    assert len(calls) == 3